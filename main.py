@@ -12,14 +12,51 @@ import logging
 import subprocess
 from pathlib import Path
 import threading
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
-import cv2
 import shutil
 from datetime import datetime
 import re
+import json
+import io
 import random
+import bisect
+import math
+import signal
+import shelve
+import atexit
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
 
 VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'}
+_VIDEO_EXT_LC = frozenset(ext[1:] for ext in VIDEO_EXTENSIONS)  # 小写、不含点
+PROBE_WORKERS = min(32, (os.cpu_count() or 4) * 4)  # 导入视频时并行探测时长的线程数
+DIMENSION_CACHE_SIZE = 1024  # 视频尺寸缓存的最大条目数
+FFMPEG_ERROR_LINES = 200  # 失败时保留的ffmpeg输出行数
+UI_DRAIN_INTERVAL_MS = 50  # Tk线程处理后台界面更新的间隔
+UI_DRAIN_MAX_ITEMS = 64  # 每次最多处理的界面更新数
+BATCH_CLIP_SECONDS = 10  # 不超过该时长的短视频合并到同一个ffmpeg进程处理
+BATCH_MAX_JOBS = 8  # 每个ffmpeg进程最多合并处理的视频数
+GPU_SESSION_LIMIT = 3  # 消费级显卡可同时打开的硬件编码会话数
+MAX_CONCURRENT_JOBS = os.cpu_count() or 1  # 并发ffmpeg任务数上限
+DEFAULT_CONCURRENT_JOBS = max(1, min(4, MAX_CONCURRENT_JOBS // 2))  # 默认并发数
+FFMPEG_THREADS_ENV = "VIDEO_OVERLAY_FFMPEG_THREADS"  # 手动指定每个ffmpeg进程的线程数
+_UNSET = object()  # 缓存尚未填充的标记
+
+# 启动子进程时隐藏控制台窗口，所有 subprocess 调用共用同一份参数
+if os.name == 'nt':
+    _STARTUPINFO = subprocess.STARTUPINFO()
+    _STARTUPINFO.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    _STARTUPINFO.wShowWindow = subprocess.SW_HIDE
+    _POPEN_KW = {"creationflags": subprocess.CREATE_NO_WINDOW, "startupinfo": _STARTUPINFO}
+else:
+    _POPEN_KW = {}
+
+_SANITIZE_RE = re.compile(r'[<>:"/\\|?*]')
 
 def setup_logging():
     logs_dir = "logs"
@@ -40,39 +77,68 @@ def setup_logging():
     return log_file
 
 def sanitize_filename(filename):
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-    base, ext = os.path.splitext(filename)
+    filename = _SANITIZE_RE.sub('_', filename)
     if len(filename) > 255:
+        base, ext = os.path.splitext(filename)
         return base[:255-len(ext)] + ext
     return filename
 
-def get_video_duration(video_path, ffmpeg_path=None):
-    """使用OpenCV获取视频时长"""
+def decode_ffmpeg_output(lines):
+    """将收集的ffmpeg输出字节行解码为文本"""
+    return b"\n".join(lines).decode('utf-8', errors='replace')
+
+def suspend_process(pid, suspended):
+    """挂起或恢复子进程：POSIX上发送 SIGSTOP/SIGCONT，Windows上调用 NtSuspendProcess/NtResumeProcess"""
     try:
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            logging.error(f"无法打开视频文件: {video_path}")
-            return 0
-            
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        if fps <= 0 or frame_count <= 0:
-            logging.error(f"无效的视频参数: fps={fps}, frames={frame_count}")
-            return 0
-            
-        duration = frame_count / fps
-        cap.release()
-        
+        if os.name == 'nt':
+            import ctypes
+            kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+            ntdll = ctypes.WinDLL("ntdll")
+            kernel32.OpenProcess.restype = ctypes.c_void_p
+            kernel32.CloseHandle.argtypes = [ctypes.c_void_p]
+            ntdll.NtSuspendProcess.argtypes = [ctypes.c_void_p]
+            ntdll.NtResumeProcess.argtypes = [ctypes.c_void_p]
+            handle = kernel32.OpenProcess(0x0800, False, pid)  # PROCESS_SUSPEND_RESUME
+            if not handle:
+                raise ctypes.WinError(ctypes.get_last_error())
+            try:
+                (ntdll.NtSuspendProcess if suspended else ntdll.NtResumeProcess)(handle)
+            finally:
+                kernel32.CloseHandle(handle)
+        else:
+            os.kill(pid, signal.SIGSTOP if suspended else signal.SIGCONT)
+    except Exception as e:
+        logging.warning(f"{'挂起' if suspended else '恢复'}进程 {pid} 失败: {str(e)}")
+
+def get_video_duration_ffprobe(video_path, ffprobe_path=None):
+    """使用ffprobe从容器头读取视频时长，失败时返回0"""
+    command = [
+        ffprobe_path or get_ffprobe_path(),
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "format=duration",
+        "-of", "default=nw=1:nk=1",
+        video_path
+    ]
+    try:
+        result = subprocess.run(command,
+                                capture_output=True,
+                                text=True,
+                                **_POPEN_KW)
+        duration = float(result.stdout.strip())
         if duration > 0:
             return duration
-        else:
-            logging.error(f"计算得到的视频时长无效: {duration}")
-            return 0
-            
+        logging.warning(f"ffprobe返回的视频时长无效: {duration}")
     except Exception as e:
-        logging.error(f"获取视频时长失败: {str(e)}")
-        return 0
+        logging.warning(f"使用ffprobe获取视频时长失败: {str(e)}")
+    return 0
+
+def get_video_duration(video_path, ffprobe_path=None):
+    """获取视频时长，失败时返回0"""
+    duration = get_video_duration_ffprobe(video_path, ffprobe_path)
+    if duration <= 0:
+        logging.error(f"获取视频时长失败: {video_path}")
+    return duration
 
 def is_video_file(file_path):
     return Path(file_path).suffix.lower() in VIDEO_EXTENSIONS
@@ -91,88 +157,38 @@ def get_ffmpeg_path():
             
     return "ffmpeg"
 
-def normalize_path(path):
-    """规范化路径，处理中文和特殊字符"""
-    try:
-        # 确保路径是字符串类型
-        if isinstance(path, bytes):
-            try:
-                path = path.decode('utf-8')
-            except UnicodeDecodeError:
-                try:
-                    path = path.decode('gbk')
-                except UnicodeDecodeError:
-                    path = path.decode('utf-8', errors='replace')
-        
-        # 规范化路径分隔符
-        path = os.path.normpath(path)
-        
-        # 处理 Windows 路径中的反斜杠
-        path = path.replace('\\', '/')
-        
-        return path
-    except Exception as e:
-        logging.error(f"规范化路径失败: {str(e)}")
-        return path
+def get_ffprobe_path():
+    """查找与ffmpeg一同分发的ffprobe"""
+    ffmpeg_path = get_ffmpeg_path()
+    if os.path.isabs(ffmpeg_path):
+        ffprobe_path = os.path.join(os.path.dirname(ffmpeg_path), "ffprobe.exe")
+        if os.path.exists(ffprobe_path):
+            return ffprobe_path
 
-def ensure_directory(path):
-    """确保目录存在，支持中文路径"""
-    try:
-        directory = os.path.dirname(path)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory, exist_ok=True)
-        return True
-    except Exception as e:
-        logging.error(f"创建目录失败: {str(e)}")
-        return False
+    return "ffprobe"
+
+def get_cache_dir():
+    """返回用户缓存目录，不存在时创建"""
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    cache_dir = os.path.join(base, "video_overlay")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
 
-def prepare_path(path, is_output=False):
-    """准备路径，确保正确处理中文字符"""
+def open_meta_cache():
+    """打开持久化的视频信息缓存，失败时退回内存字典"""
     try:
-        # 将路径转换为绝对路径并规范化
-        abs_path = os.path.abspath(os.path.normpath(path))
-        
-        # 如果是输出路径，确保目录存在
-        if is_output:
-            output_dir = os.path.dirname(abs_path)
-            os.makedirs(output_dir, exist_ok=True)
-        
-        # 处理中文路径
-        try:
-            # 对于包含中文的路径，直接使用原始路径，但确保使用正斜杠
-            safe_path = abs_path.replace('\\', '/')
-            
-            # 检查路径是否存在
-            if not os.path.exists(os.path.dirname(safe_path)):
-                raise Exception(f"目录不存在: {os.path.dirname(safe_path)}")
-            
-            # 如果是输出路径，不检查文件是否存在
-            if not is_output and not os.path.exists(safe_path):
-                raise Exception(f"文件不存在: {safe_path}")
-            
-            # 对于包含中文的路径，不使用引号包裹
-            if any(ord(c) > 127 for c in safe_path):
-                return safe_path
-            else:
-                return f'"{safe_path}"'
-            
-        except Exception as e:
-            logging.warning(f"处理路径失败: {str(e)}")
-            # 如果处理失败，尝试使用短路径名
-            try:
-                import win32api
-                short_path = win32api.GetShortPathName(abs_path)
-                if short_path and short_path != abs_path:
-                    return f'"{short_path}"'
-            except Exception as e:
-                logging.debug(f"获取短路径失败: {str(e)}")
-            
-            # 如果所有方法都失败，返回原始路径
-            return f'"{path}"'
-            
+        cache = shelve.open(os.path.join(get_cache_dir(), "meta.db"))
+        atexit.register(cache.close)
+        return cache
     except Exception as e:
-        logging.error(f"处理路径出错: {str(e)}")
-        return f'"{path}"'
+        logging.warning(f"无法打开视频信息缓存，仅在内存中缓存: {str(e)}")
+        return {}
+
+class ProcessingStopped(Exception):
+    """用户停止处理时中断任务，只清理输出，不作为错误记录"""
 
 class VideoOverlayApp:
     def __init__(self, root):
@@ -185,23 +201,60 @@ class VideoOverlayApp:
         # 初始化变量
         self.main_video_paths = []  # A组视频列表
         self.overlay_video_paths = []  # B组视频列表
+        self._main_set = set()  # A组视频路径集合，用于快速查重
+        self._overlay_set = set()  # B组视频路径集合，用于快速查重
         self.main_video_durations = {}  # 存储A组视频时长
         self.overlay_video_durations = {}  # 存储B组视频时长
+        self._overlay_sorted = []  # 按时长排序的B组视频 (时长, 路径)
+        self._prepared_paths = {}  # 视频路径 -> 传给ffmpeg的规范化绝对路径
         self.output_directory = None
         self.opacity_var = tk.DoubleVar(value=2)
         self.processing = False
         self.paused = False
         self.current_processes = {}
         self.start_time = 0
-        self.max_concurrent_processes = 3
-        self.processing_semaphore = threading.Semaphore(self.max_concurrent_processes)
+        self._pause_started = 0  # 本次暂停开始的时间
+        self.concurrency_var = tk.IntVar(value=DEFAULT_CONCURRENT_JOBS)
+        self.max_concurrent_jobs = DEFAULT_CONCURRENT_JOBS  # 开始处理时从界面读取
+        self._batch_tasks = []  # 当前批次中尚未完成的任务
+        self._running_tasks = set()  # 已开始处理视频的任务，停止时等待其ffmpeg退出
+        self._stopping = False  # 已请求停止，本批次的任务尚未全部退出
+        self._resume_event = None  # 未暂停时置位，等待中的任务在此休眠
+        self._loop = None  # 驱动所有ffmpeg子进程的事件循环
+        self._completed_count = 0
+        self._failed_videos = []  # 本批次处理失败的主视频
+        self._active_progress = {}  # 进程标识 -> 进行中任务已完成的文件数
+        self._batch_opacity = 0.0  # 开始处理时读取的设置，供后台线程使用
+        self._batch_use_gpu = False
+        self._batch_gpu_type = None  # 本批次实际使用的GPU类型，开始处理时检测一次
+        self._slot_lock = None  # 多名额任务依次获取名额，开始处理时在事件循环中创建
+        self._cmd_templates = {}  # (GPU类型, 是否使用CUDA滤镜, 每组视频数) -> 本批次的命令模板
         self.use_gpu = tk.BooleanVar(value=True)  # 默认启用GPU
+        self._gpu_type_cache = _UNSET  # GPU检测结果缓存
+        self._gpu_type_lock = threading.Lock()  # 保护检测结果
+        self._gpu_detect_lock = threading.Lock()  # 串行执行检测
+        self._gpu_redetect = False
+        self._gpu_generation = 0  # 每次使缓存失效时加一
+        self._cuda_filters = False  # 与GPU类型一同检测
+        self._last_use_gpu = self.use_gpu.get()
+        self.use_gpu.trace_add("write", self._on_use_gpu_changed)
+        self._dim_cache = OrderedDict()  # (路径, mtime, 大小) -> (宽, 高)
+        self._dim_cache_lock = threading.Lock()
+        self._meta_cache = open_meta_cache()  # 时长、预览等探测结果，跨启动保留
+        self._meta_cache_lock = threading.Lock()
+        self._ui_queue = queue.SimpleQueue()  # 后台线程 -> Tk线程的界面更新 (类型, 参数)
         
-        # 获取ffmpeg路径
+        # 获取ffmpeg/ffprobe路径
         self.ffmpeg_path = get_ffmpeg_path()
+        self.ffprobe_path = get_ffprobe_path()
+        
+        # 启动时在后台完成GPU检测，开始处理时直接使用结果
+        if self.use_gpu.get():
+            threading.Thread(target=self._gpu_type, daemon=True).start()
         
         # 创建UI布局
         self.setup_ui()
+        self.root.after(UI_DRAIN_INTERVAL_MS, self._drain_ui_queue)
         
         # 设置文件选择功能
         self.setup_file_handlers()
@@ -258,85 +311,159 @@ class VideoOverlayApp:
                 filetypes=[("视频文件", "*.mp4 *.avi *.mkv *.mov *.wmv *.flv")]
             )
             if files:
-                for file in files:
-                    self.add_video(file, target)
+                self.import_videos(list(files), target)
 
-    def import_folder(self, folder_path, target):
-        """导入文件夹中的视频"""
+    def _collect_folder_videos(self, folder_path):
+        """递归查找文件夹中的视频文件"""
+        video_paths = []
         for root, _, files in os.walk(folder_path):
             for file in files:
-                file_path = os.path.join(root, file)
-                if is_video_file(file_path):
-                    self.add_video(file_path, target)
-
-    def add_video(self, video_path, target):
-        """添加视频到列表"""
-        duration = get_video_duration(video_path, self.ffmpeg_path)
-        if duration == 0:
-            messagebox.showerror("错误", f"无法读取视频: {video_path}")
+                # 直接比较扩展名，避免为每个文件构造 Path 对象
+                i = file.rfind('.')
+                if i >= 0 and file[i+1:].lower() in _VIDEO_EXT_LC:
+                    video_paths.append(os.path.join(root, file))
+        return video_paths
+
+    def import_folder(self, folder_path, target):
+        """导入文件夹中的视频，在后台线程中并行探测时长"""
+        self.import_videos(self._collect_folder_videos(folder_path), target)
+
+    def import_videos(self, video_paths, target):
+        """导入一批视频，在后台线程中并行探测时长"""
+        if not video_paths:
             return
 
+        threading.Thread(
+            target=self._probe_videos_thread,
+            args=(video_paths, target),
+            daemon=True
+        ).start()
+
+    def _cached_meta(self, kind, video_path, compute):
+        """按 (绝对路径, 修改时间, 大小) 缓存探测结果，只缓存成功的结果"""
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return compute()
+        key = f"{kind}:{os.path.abspath(video_path)}:{st.st_mtime_ns}:{st.st_size}"
+
+        with self._meta_cache_lock:
+            try:
+                return self._meta_cache[key]
+            except KeyError:
+                pass
+            except Exception as e:
+                logging.warning(f"读取视频信息缓存失败: {str(e)}")
+
+        value = compute()
+        if value:
+            with self._meta_cache_lock:
+                try:
+                    self._meta_cache[key] = value
+                except Exception as e:
+                    logging.warning(f"写入视频信息缓存失败: {str(e)}")
+        return value
+
+    def _probe_durations(self, video_paths):
+        """并行探测一批视频的时长，返回 路径 -> 时长"""
+        with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(video_paths))) as executor:
+            return dict(zip(video_paths, executor.map(
+                lambda path: self._cached_meta(
+                    "duration", path, lambda: get_video_duration(path, self.ffprobe_path)
+                ),
+                video_paths
+            )))
+
+    def _probe_videos_thread(self, video_paths, target):
+        """探测视频时长，完成后回到主线程统一添加"""
+        durations = self._probe_durations(video_paths)
+        self._post_ui("call", self._add_probed_videos, durations, target)
+
+    def _add_probed_videos(self, durations, target):
+        """添加已探测时长的视频，新条目一次性追加到列表末尾"""
+        failed = []
+        added = []
+        for video_path, duration in durations.items():
+            if duration == 0:
+                failed.append(video_path)
+                continue
+            if self._store_video(video_path, duration, target):
+                added.append(video_path)
+
+        self._append_rows(target, added)
+
+        if failed:
+            logging.error(f"无法读取 {len(failed)} 个视频: {failed}")
+            messagebox.showerror("错误", self._summarize("无法读取以下视频:", failed))
+
+    def _store_video(self, video_path, duration, target):
+        """记录视频及其时长，已存在时返回False"""
+        self._prepared_paths[video_path] = os.path.abspath(os.path.normpath(video_path))
         if target == "main":
-            if video_path not in self.main_video_paths:
-                self.main_video_paths.append(video_path)
-                self.main_video_durations[video_path] = duration
-                self.update_main_video_list()
+            if video_path in self._main_set:
+                return False
+            self._main_set.add(video_path)
+            self.main_video_paths.append(video_path)
+            self.main_video_durations[video_path] = duration
         else:
-            if video_path not in self.overlay_video_paths:
-                self.overlay_video_paths.append(video_path)
-                self.overlay_video_durations[video_path] = duration
-                self.update_overlay_video_list()
+            if video_path in self._overlay_set:
+                return False
+            self._overlay_set.add(video_path)
+            self.overlay_video_paths.append(video_path)
+            self.overlay_video_durations[video_path] = duration
+            self._index_overlay(video_path, duration)
+        return True
+
+    def _index_overlay(self, path, duration):
+        """将叠加视频加入按时长排序的索引"""
+        bisect.insort(self._overlay_sorted, (duration, path))
+
+    def _unindex_overlay(self, path, duration):
+        """从按时长排序的索引中移除叠加视频"""
+        index = bisect.bisect_left(self._overlay_sorted, (duration, path))
+        if index < len(self._overlay_sorted) and self._overlay_sorted[index] == (duration, path):
+            del self._overlay_sorted[index]
+
+    def _suitable_overlay_range(self, main_video_path):
+        """返回时长合适的叠加视频在排序索引中的区间 [lo, hi)"""
+        # 优先使用添加视频时已缓存的时长，避免重复探测
+        main_duration = (self.main_video_durations.get(main_video_path)
+                         or get_video_duration(main_video_path, self.ffprobe_path))
+        if main_duration <= 0:
+            logging.warning(f"无法获取主视频时长: {main_video_path}")
+            return 0, 0
+
+        logging.info(f"主视频 {os.path.basename(main_video_path)} 时长: {main_duration:.2f}秒")
 
-    def get_suitable_overlay_videos(self, main_video_path):
-        """获取适合的叠加视频"""
+        # 确保叠加视频时长大于主视频时长
+        # 允许叠加视频最长为主视频的3倍，以避免文件过大
+        min_duration = main_duration
+        max_duration = main_duration * 3.0
+
+        # 在按时长排序的索引中二分查找 [min_duration, max_duration] 区间
+        lo = bisect.bisect_left(self._overlay_sorted, (min_duration,))
+        hi = bisect.bisect_left(self._overlay_sorted,
+                                (math.nextafter(max_duration, math.inf),))
+
+        if lo >= hi:
+            logging.warning(
+                f"未找到合适的叠加视频，共检查了 {len(self.overlay_video_paths)} 个视频。"
+                f"需要时长大于 {main_duration:.2f}秒 的视频"
+            )
+        else:
+            logging.info(f"共找到 {hi - lo} 个合适的叠加视频")
+        return lo, hi
+
+    def select_random_overlay_video(self, main_video_path):
+        """随机选择一个时长合适的叠加视频，直接在索引区间内取值，不构造候选列表"""
         try:
-            main_duration = get_video_duration(main_video_path)
-            if main_duration <= 0:
-                logging.warning(f"无法获取主视频时长: {main_video_path}")
-                return []
-            
-            logging.info(f"主视频 {os.path.basename(main_video_path)} 时长: {main_duration:.2f}秒")
-            suitable_videos = []
-            
-            for overlay_path in self.overlay_video_paths:
-                overlay_duration = get_video_duration(overlay_path)
-                if overlay_duration <= 0:
-                    logging.warning(f"无法获取叠加视频时长: {overlay_path}")
-                    continue
-                
-                # 确保叠加视频时长大于主视频时长
-                # 允许叠加视频最长为主视频的3倍，以避免文件过大
-                min_duration = main_duration
-                max_duration = main_duration * 3.0
-                
-                logging.debug(f"检查叠加视频 {os.path.basename(overlay_path)}: "
-                             f"时长 {overlay_duration:.2f}秒, "
-                             f"需要 >= {min_duration:.2f}秒")
-                
-                if min_duration <= overlay_duration <= max_duration:
-                    suitable_videos.append(overlay_path)
-                    logging.info(f"找到合适的叠加视频: {os.path.basename(overlay_path)} "
-                               f"({overlay_duration:.2f}秒)")
-            
-            if not suitable_videos:
-                logging.warning(
-                    f"未找到合适的叠加视频，共检查了 {len(self.overlay_video_paths)} 个视频。"
-                    f"需要时长大于 {main_duration:.2f}秒 的视频"
-                )
-            else:
-                logging.info(f"共找到 {len(suitable_videos)} 个合适的叠加视频")
-            
-            return suitable_videos
-            
+            lo, hi = self._suitable_overlay_range(main_video_path)
         except Exception as e:
             logging.error(f"查找合适的叠加视频时出错: {str(e)}")
-            return []
-
-    def select_random_overlay_video(self, main_video_path):
-        suitable_videos = self.get_suitable_overlay_videos(main_video_path)
-        if not suitable_videos:
             return None
-        return random.choice(suitable_videos)
+        if lo >= hi:
+            return None
+        return self._overlay_sorted[random.randrange(lo, hi)][1]
 
     def setup_ui(self):
         # 创建主视频区域框架
@@ -459,9 +586,22 @@ class VideoOverlayApp:
         gpu_frame = ttk.Frame(control_frame)
         gpu_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        ttk.Checkbutton(gpu_frame, 
-                        text="使用GPU加速", 
-                        variable=self.use_gpu).pack(side=tk.LEFT)
+        self.gpu_checkbutton = ttk.Checkbutton(gpu_frame, 
+                                               text="使用GPU加速", 
+                                               variable=self.use_gpu)
+        self.gpu_checkbutton.pack(side=tk.LEFT)
+
+        # 并发任务数设置
+        ttk.Label(gpu_frame, text="并发任务数:").pack(side=tk.LEFT, padx=(15, 0))
+        self.concurrency_spinbox = ttk.Spinbox(gpu_frame,
+                                               from_=1,
+                                               to=MAX_CONCURRENT_JOBS,
+                                               textvariable=self.concurrency_var,
+                                               width=5)
+        self.concurrency_spinbox.pack(side=tk.LEFT, padx=5)
+
+        # 处理期间需要禁用的设置控件
+        self._toggleable_widgets = [self.opacity_scale, self.gpu_checkbutton, self.concurrency_spinbox]
 
         # 设置样式
         style = ttk.Style()
@@ -479,11 +619,13 @@ class VideoOverlayApp:
             listbox = self.video_listbox
             paths = self.main_video_paths
             durations = self.main_video_durations
+            path_set = self._main_set
             prefix = "Main"  
         else:
             listbox = self.overlay_listbox
             paths = self.overlay_video_paths
             durations = self.overlay_video_durations
+            path_set = self._overlay_set
             prefix = f"video_{target}"
             
         selected = listbox.curselection()
@@ -516,15 +658,21 @@ class VideoOverlayApp:
             for i, path in enumerate(paths):
                 if path in renamed_paths:
                     new_path = renamed_paths[path]
+                    listbox.delete(i)
                     paths[i] = new_path
+                    path_set.discard(path)
+                    path_set.add(new_path)
+                    self._prepared_paths.pop(path, None)
+                    self._prepared_paths[new_path] = os.path.abspath(new_path)
                     if target == "main":
                         self.main_video_durations[new_path] = durations[path]
                         del self.main_video_durations[path]
                     else:
                         self.overlay_video_durations[new_path] = durations[path]
+                        self._unindex_overlay(path, durations[path])
+                        self._index_overlay(new_path, durations[path])
                         del self.overlay_video_durations[path]
-            
-            self.update_main_video_list() if target == "main" else self.update_overlay_video_list()
+                    listbox.insert(i, self._format_row(new_path, durations))
             
             messagebox.showinfo("成功", "文件重命名完成")
             
@@ -540,23 +688,36 @@ class VideoOverlayApp:
         
     def get_video_preview(self, video_path, size=(200, 120)):
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
+            data = self._cached_meta(f"thumbfit{size[0]}x{size[1]}", video_path,
+                                     lambda: self._fast_thumbnail(video_path, size))
+            if not data:
                 return None
-                
-            ret, frame = cap.read()
-            cap.release()
-            
-            if not ret:
-                return None
-                
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_resized = cv2.resize(frame_rgb, size)
-            image = Image.fromarray(frame_resized)
-            return ImageTk.PhotoImage(image)
+            return ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
         except Exception as e:
-            print(f"获取预览图失败: {str(e)}")
+            logging.error(f"获取预览图失败: {str(e)}")
             return None
+
+    def _fast_thumbnail(self, video_path, size):
+        """用ffmpeg快速定位并只解码一帧，按原始宽高比缩放到 size 以内，返回JPEG数据"""
+        # 太短的视频定位到0.5秒后没有画面，再从头取一帧
+        for seek in ("0.5", "0"):
+            command = [
+                self.ffmpeg_path,
+                "-v", "error",
+                "-ss", seek,
+                "-i", video_path,
+                "-frames:v", "1",
+                "-vf", f"scale={size[0]}:{size[1]}:force_original_aspect_ratio=decrease",
+                "-f", "image2pipe",
+                "-vcodec", "mjpeg",
+                "-"
+            ]
+            result = subprocess.run(command,
+                                    capture_output=True,
+                                    **_POPEN_KW)
+            if result.returncode == 0 and result.stdout:
+                return result.stdout
+        return None
         
     def start_processing(self):
         """开始处理视频"""
@@ -566,19 +727,28 @@ class VideoOverlayApp:
         if not self.overlay_video_paths:
             messagebox.showwarning("警告", "请先添加叠加视频")
             return
+        # 上一批次的任务退出前不开始新的批次
+        if self.processing or self._stopping:
+            return
         
         try:
             self.processing = True
             self.paused = False
             self.start_time = time.time()
+            # 在Tk主线程读取一次设置，后台任务不再访问Tk变量
+            self._batch_opacity = self.opacity_var.get() / 100.0
+            self._batch_use_gpu = self.use_gpu.get()
+            try:
+                jobs = self.concurrency_var.get()
+            except tk.TclError:
+                jobs = DEFAULT_CONCURRENT_JOBS
+            self.max_concurrent_jobs = max(1, min(MAX_CONCURRENT_JOBS, jobs))
+            self.concurrency_var.set(self.max_concurrent_jobs)
+            self._cmd_templates = {}  # 设置已确定，本批次的命令模板首次使用时生成
             self.update_buttons_state()  # 立即更新按钮状态
             
-            # 启动处理线程
-            processing_thread = threading.Thread(
-                target=self._process_videos_thread,
-                daemon=True
-            )
-            processing_thread.start()
+            # 在后台事件循环中调度处理任务
+            asyncio.run_coroutine_threadsafe(self._process_videos(), self._ensure_event_loop())
             
         except Exception as e:
             self.processing = False
@@ -587,358 +757,707 @@ class VideoOverlayApp:
             self.update_buttons_state()
 
     def get_video_dimensions(self, video_path):
+        """获取视频尺寸，按 (路径, 修改时间, 大小) 缓存结果"""
+        try:
+            st = os.stat(video_path)
+            key = (video_path, st.st_mtime_ns, st.st_size)
+        except OSError as e:
+            logging.warning(f"读取视频文件信息失败: {str(e)}")
+            return self._probe_video_dimensions(video_path)
+
+        with self._dim_cache_lock:
+            if key in self._dim_cache:
+                self._dim_cache.move_to_end(key)
+                return self._dim_cache[key]
+
+        width, height = self._probe_video_dimensions(video_path)
+        if width and height:
+            with self._dim_cache_lock:
+                self._dim_cache[key] = (width, height)
+                while len(self._dim_cache) > DIMENSION_CACHE_SIZE:
+                    self._dim_cache.popitem(last=False)
+        return width, height
+
+    def _probe_video_dimensions(self, video_path):
         probe_cmd = [
-            self.ffmpeg_path,
-            "-i", video_path,
-            "-v", "quiet",
+            self.ffprobe_path,
+            "-v", "error",
             "-select_streams", "v:0",
             "-show_entries", "stream=width,height",
-            "-of", "default=noprint_wrappers=1:nokey=1"
+            "-of", "json",
+            video_path
         ]
         
         try:
             result = subprocess.run(probe_cmd, 
                                   capture_output=True, 
                                   text=True,
-                                  creationflags=subprocess.CREATE_NO_WINDOW)
-            if result.stdout.strip():
-                width, height = map(int, result.stdout.strip().split('\n'))
-                logging.info(f"使用ffmpeg获取视频尺寸成功: {width}x{height}")
+                                  **_POPEN_KW)
+            if result.returncode == 0:
+                stream = json.loads(result.stdout)["streams"][0]
+                width, height = int(stream["width"]), int(stream["height"])
+                logging.info(f"使用ffprobe获取视频尺寸成功: {width}x{height}")
                 return width, height
+            logging.warning(f"ffprobe退出码 {result.returncode}: {result.stderr.strip()}")
+        except Exception as e:
+            logging.warning(f"使用ffprobe获取视频尺寸失败: {str(e)}")
+        
+        return None, None
+
+    def _prepare_job(self, main_video_path, overlay_video_path):
+        """确定输出路径并获取主视频尺寸，返回一个处理任务"""
+        main_duration = self.main_video_durations.get(main_video_path, 0)
+        
+        if self.output_directory and os.path.exists(self.output_directory):
+            output_dir = self.output_directory
+        else:
+            output_dir = os.path.join(os.path.dirname(main_video_path), "output")
+        
+        try:
+            os.makedirs(output_dir, exist_ok=True)
         except Exception as e:
-            logging.warning(f"使用ffmpeg获取视频尺寸失败: {str(e)}")
+            logging.error(f"创建输出目录失败: {str(e)}")
+            raise
+        
+        main_video_name = os.path.splitext(os.path.basename(main_video_path))[0]
+        overlay_name = os.path.splitext(os.path.basename(overlay_video_path))[0]
+        output_name = f"output_{main_video_name}_C_{overlay_name}.mp4"
+        output_path = os.path.abspath(os.path.join(output_dir, sanitize_filename(output_name)))
+        
+        # 使用添加视频时已规范化的路径
+        main_video_path = (self._prepared_paths.get(main_video_path)
+                           or os.path.abspath(os.path.normpath(main_video_path)))
+        overlay_video_path = (self._prepared_paths.get(overlay_video_path)
+                              or os.path.abspath(os.path.normpath(overlay_video_path)))
+        
+        # 记录实际使用的路径
+        logging.info(f"处理视频:")
+        logging.info(f"主视频: {main_video_path}")
+        logging.info(f"叠加视频: {overlay_video_path}")
+        logging.info(f"输出文件: {output_path}")
+        
+        # 获取视频尺寸
+        width, height = self.get_video_dimensions(main_video_path)
+        if not width or not height:
+            raise Exception(f"无法获取视频尺寸: {main_video_path}")
+        
+        return {
+            "main": main_video_path,
+            "overlay": overlay_video_path,
+            "output": output_path,
+            "width": width,
+            "height": height,
+            "duration": main_duration,
+        }
+
+    def _get_encoder_settings(self, gpu_type):
+        """根据GPU类型返回 (编码器, 预设, 编码器参数)"""
+        if gpu_type == "NVIDIA":
+            video_encoder = 'h264_nvenc'
+            encoder_preset = 'p1'
+            gpu_params = [
+                "-rc", "vbr",
+                "-b:v", "8M",
+                "-maxrate", "12M",
+                "-bufsize", "16M",
+                "-profile:v", "high",
+                "-level", "5.2",
+                "-spatial-aq", "1",
+                "-temporal-aq", "1",
+                "-cq", "16",
+                "-qmin", "1",
+                "-qmax", "51",
+                "-rc-lookahead", "32"
+            ]
+        elif gpu_type == "AMD":
+            video_encoder = 'h264_amf'
+            encoder_preset = 'quality'
+            gpu_params = [
+                "-quality", "quality",
+                "-rc", "vbr_peak",
+                "-b:v", "8M",
+                "-maxrate", "12M",
+                "-bufsize", "16M",
+                "-profile:v", "high",
+                "-qmin", "1",
+                "-qmax", "51",
+                # AMF 原生输入格式为 nv12，软件叠加输出的 yuv420p 直接交织为 nv12
+                "-pix_fmt", "nv12"
+            ]
+        else:
+            video_encoder = 'libx264'
+            encoder_preset = 'slower'
+            gpu_params = [
+                "-b:v", "8M",
+                "-maxrate", "12M",
+                "-bufsize", "16M",
+                "-profile:v", "high",
+                "-level", "5.2",
+                "-movflags", "+faststart",
+                "-tune", "film",
+                "-x264opts", "me=umh:subme=10:ref=5:b-adapt=2:direct=auto:rc-lookahead=60:no-fast-pskip=1:no-dct-decimate=1",
+                "-psy-rd", "1.0:0.15"
+            ]
+        return video_encoder, encoder_preset, gpu_params
+
+    def _build_filter(self, index, job, gpu_type, overlay_alpha, cuda_filters):
+        """构建第 index 组 (主视频, 叠加视频) 输入的 filter_complex 片段，输出标签为 [outv{index}]"""
+        main_in, overlay_in = 2 * index, 2 * index + 1
+        width, height = job["width"], job["height"]
+        if cuda_filters:
+            # 主视频在GPU上解码并叠加，避免每帧在显存与内存之间往返；
+            # overlay_cuda 没有透明度参数，叠加视频在CPU上缩放并写入alpha平面后上传
+            return (
+                f"[{overlay_in}:v]scale={width}:{height},format=yuva420p,"
+                f"lutyuv=a={overlay_alpha},hwupload_cuda[overlay{index}];"
+                f"[{main_in}:v]scale_cuda=format=yuv420p[base{index}];"
+                f"[base{index}][overlay{index}]overlay_cuda=0:0:shortest=1[outv{index}]"
+            )
+        # 全程在 YUV 空间叠加；NVENC 原生输入格式为 nv12，在滤镜链末尾直接交织
+        to_nv12 = ",format=nv12" if gpu_type == "NVIDIA" else ""
+        return (
+            f"[{overlay_in}:v]scale={width}:{height},format=yuva420p,"
+            f"lutyuv=a={overlay_alpha}[overlay{index}];"
+            f"[{main_in}:v][overlay{index}]overlay=0:0:shortest=1:format=yuv420{to_nv12}[outv{index}]"
+        )
+
+    def _ffmpeg_threads_per_invocation(self):
+        """每个ffmpeg进程可用的线程数，避免多个并发进程抢占CPU"""
+        override = os.environ.get(FFMPEG_THREADS_ENV)
+        if override:
+            try:
+                return max(1, int(override))
+            except ValueError:
+                logging.warning(f"忽略无效的 {FFMPEG_THREADS_ENV}: {override}")
+        jobs = max(1, self.max_concurrent_jobs)
+        return max(1, (os.cpu_count() or jobs) // jobs)
+
+    def _build_cmd_template(self, gpu_type, cuda_filters, group_size=1):
+        """生成与具体视频无关的命令片段，同一批次内按 (GPU类型, 是否使用CUDA滤镜, 每组视频数) 缓存"""
+        key = (gpu_type, cuda_filters, group_size)
+        template = self._cmd_templates.get(key)
+        if template is not None:
+            return template
+        
+        video_encoder, encoder_preset, gpu_params = self._get_encoder_settings(gpu_type)
+        
+        if cuda_filters:
+            main_input_args = ("-hwaccel", "cuda", "-hwaccel_output_format", "cuda")
+        else:
+            main_input_args = ("-hwaccel", "auto" if gpu_type else "none")
+        
+        prefix = (
+            self.ffmpeg_path,
+            "-y",
+            "-progress", "pipe:1",
+            "-nostats"
+        )
+        # CPU编码时限制解码、滤镜和编码线程数；GPU编码不受CPU线程数限制。
+        # 整组共用一个滤镜图，而每个输入和输出都会按 -threads 启动线程，按组内视频数分摊
+        thread_args = ()
+        if not gpu_type:
+            threads = self._ffmpeg_threads_per_invocation()
+            thread_args = ("-threads", str(max(1, threads // group_size)))
+            prefix += ("-filter_threads", str(threads), "-filter_complex_threads", str(threads))
+        main_input_args += thread_args
+        # 叠加视频在CPU上解码，只限制线程数
+        overlay_input_args = thread_args
+        
+        output_args = (
+            "-c:a", "aac",
+            "-b:a", "320k",
+            "-ar", "48000",
+            "-c:v", video_encoder,
+            "-preset", encoder_preset,
+            *thread_args,
+            "-shortest",
+            # 添加编码器特定参数
+            *gpu_params
+        )
+        
+        template = (prefix, main_input_args, overlay_input_args, output_args)
+        self._cmd_templates[key] = template
+        return template
+
+    def _build_command(self, jobs, gpu_type, cuda_filters=False):
+        """构建ffmpeg命令，一次调用可处理多组 (主视频, 叠加视频)，每组写入各自的输出文件"""
+        prefix, main_input_args, overlay_input_args, output_args = \
+            self._build_cmd_template(gpu_type, cuda_filters, len(jobs))
+        # 叠加视频的透明度直接写入 yuva420p 的 alpha 平面，无需转换为 RGBA
+        overlay_alpha = round(self._batch_opacity * 255)
+        
+        command = list(prefix)
+        filters = []
+        for index, job in enumerate(jobs):
+            command.extend(main_input_args)
+            command.extend(("-i", job["main"]))
+            command.extend(overlay_input_args)
+            command.extend(("-i", job["overlay"]))
+            filters.append(self._build_filter(index, job, gpu_type, overlay_alpha, cuda_filters))
+        
+        command.extend(["-filter_complex", ";".join(filters)])
         
+        for index, job in enumerate(jobs):
+            command.extend(("-map", f"[outv{index}]", "-map", f"{2 * index}:a"))
+            command.extend(output_args)
+            # 添加输出路径
+            command.append(job["output"])
+        
+        return command
+
+    async def _run_ffmpeg(self, command, process_key, duration, total_videos, weight=1):
+        """执行ffmpeg并监控进程，失败时抛出异常，返回收集到的错误输出"""
+        # 记录完整命令
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("执行命令: %s", ' '.join(str(x) for x in command))
+        
+        # 执行命令，输出管道由事件循环统一读取
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,  # 停止时写入 q 让ffmpeg正常退出
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **_POPEN_KW
+        )
+        
+        self.current_processes[process_key] = process
+        # 暂停请求可能在进程启动期间到达
+        if self.paused and self.processing:
+            suspend_process(process.pid, True)
+        
+        # 只保留最后的输出行，避免长时间编码时警告过多占用内存
+        error_output = deque(maxlen=FFMPEG_ERROR_LINES)
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise Exception("无法打开视频文件")
+            # 停止请求可能在进程启动期间到达
+            if not self.processing:
+                self._request_quit(process)
             
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            cap.release()
+            await asyncio.gather(
+                self._read_ffmpeg_progress(process, process_key, duration, total_videos, weight),
+                self._read_ffmpeg_stderr(process, error_output)
+            )
+            await process.wait()
             
-            if width > 0 and height > 0:
-                logging.info(f"使用OpenCV获取视频尺寸成功: {width}x{height}")
-                return width, height
-            else:
-                raise Exception("获取到的尺寸无效")
-        except Exception as e:
-            logging.warning(f"使用OpenCV获取视频尺寸失败: {str(e)}")
+            # 检查进程结果；停止时被强制结束的进程不算处理失败
+            if process.returncode != 0 and not self.processing:
+                raise ProcessingStopped("处理已停止")
+            if process.returncode != 0:
+                error_msg = decode_ffmpeg_output(error_output)
+                logging.error(f"FFmpeg处理失败: {error_msg}")
+                raise Exception(f"FFmpeg处理失败: {error_msg}")
+            
+        finally:
+            # 出错时确保子进程退出
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+            
+            # 从当前进程列表中移除
+            if process_key in self.current_processes:
+                del self.current_processes[process_key]
         
-        return None, None
+        return error_output
+
+    async def _read_ffmpeg_stderr(self, process, error_output):
+        """按块读取ffmpeg的stderr输出，保留原始字节，需要显示时才解码"""
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        remainder = b""
+        while True:
+            chunk = await process.stderr.read(8192)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            for line in lines:
+                line = line.strip()
+                if line:  # 只记录非空行
+                    error_output.append(line)
+                    if debug_enabled:
+                        logger.debug("FFmpeg输出: %s", line.decode('utf-8', errors='replace'))
+        remainder = remainder.strip()
+        if remainder:
+            error_output.append(remainder)
 
-    def process_video(self, main_video_path, overlay_video_path, total_videos, processed_count):
+    async def _read_ffmpeg_progress(self, process, process_key, duration, total_videos, weight=1):
+        """解析 ffmpeg -progress 的 key=value 输出，按 out_time_us 更新当前文件进度"""
+        # 按块读取原始字节，每块只取最后一个 out_time_us，不逐行解码
+        remainder = b""
+        while True:
+            chunk = await process.stdout.read(4096)
+            if not chunk:
+                break
+            if duration <= 0:
+                continue
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            out_time_us = None
+            for line in lines:
+                if line.startswith(b"out_time_us="):
+                    out_time_us = line[12:]
+            if out_time_us is None:
+                continue
+            try:
+                out_time = int(out_time_us) / 1_000_000
+            except ValueError:
+                continue  # 刚开始时可能输出 N/A
+            fraction = min(max(out_time / duration, 0.0), 1.0)
+            self._active_progress[process_key] = fraction * weight
+            self._report_progress(total_videos)
+
+    def _report_progress(self, total_videos):
+        """汇总已完成和进行中的任务进度，交给Tk主线程显示"""
+        in_progress = sum(self._active_progress.values())
+        self._post_ui("progress", self._completed_count, total_videos, in_progress)
+
+    def _post_ui(self, kind, *payload):
+        """从后台线程提交界面更新，由Tk线程统一执行"""
+        self._ui_queue.put((kind, payload))
+
+    def _ui_error(self, message):
+        """从后台线程提交错误提示，由Tk线程显示"""
+        self._post_ui("error", message)
+
+    def _summarize(self, title, paths, limit=10):
+        """生成文件列表摘要，最多列出 limit 个"""
+        lines = [title, *paths[:limit]]
+        if len(paths) > limit:
+            lines.append(f"... 共 {len(paths)} 个")
+        return "\n".join(lines)
+
+    def _drain_ui_queue(self):
+        """在Tk线程中执行排队的界面更新，连续的进度更新只显示最新一次，错误合并为一个对话框"""
+        latest_progress = None
+        errors = []
         try:
-            with self.processing_semaphore:
-                if not self.processing:
-                    return
-                    
-                # 更新进度
-                progress = (processed_count / total_videos) * 100 if total_videos > 0 else 0
-                self.progress_var.set(progress)
-                self.status_label.configure(
-                    text=f"处理中... ({processed_count}/{total_videos})"
-                )
-                
-                # 计算剩余时间
-                elapsed_time = time.time() - self.start_time
-                if processed_count > 0:  # 修改条件，避免除零
-                    avg_time_per_video = elapsed_time / processed_count
-                    remaining_videos = total_videos - processed_count
-                    remaining_time = avg_time_per_video * remaining_videos
-                    remaining_mins = int(remaining_time // 60)
-                    remaining_secs = int(remaining_time % 60)
-                    self.time_label.configure(text=f"预计剩余时间: {remaining_mins:02d}:{remaining_secs:02d}")
-                
-                if self.output_directory and os.path.exists(self.output_directory):
-                    output_dir = self.output_directory
-                else:
-                    output_dir = os.path.join(os.path.dirname(main_video_path), "output")
-                
+            for _ in range(UI_DRAIN_MAX_ITEMS):
                 try:
-                    os.makedirs(output_dir, exist_ok=True)
+                    kind, payload = self._ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    latest_progress = payload
+                    continue
+                if kind == "error":
+                    errors.append(payload[0])
+                    continue
+                try:
+                    callback, *args = payload
+                    callback(*args)
                 except Exception as e:
-                    logging.error(f"创建输出目录失败: {str(e)}")
-                    raise
+                    logging.error(f"更新界面时出错: {str(e)}")
+            if latest_progress is not None:
+                self.update_progress(*latest_progress)
+            if errors:
+                messagebox.showerror("错误", "\n\n".join(errors))
+        finally:
+            self.root.after(UI_DRAIN_INTERVAL_MS, self._drain_ui_queue)
+
+    async def _wait_output_stable(self, output_path, attempts=10, interval=0.05):
+        """ffmpeg退出时已关闭输出文件，这里只在文件大小仍在变化时短暂等待"""
+        try:
+            # 网络文件系统上目录缓存可能滞后，先刷新一次目录列表
+            os.listdir(os.path.dirname(output_path))
+            size = os.path.getsize(output_path)
+        except OSError:
+            return
+        for _ in range(attempts):
+            await asyncio.sleep(interval)
+            try:
+                new_size = os.path.getsize(output_path)
+            except OSError:
+                return
+            if new_size == size and new_size > 0:
+                return
+            size = new_size
+
+    def _verify_output(self, output_path, error_output):
+        """验证输出文件已生成且不为空"""
+        if not os.path.exists(output_path):
+            error_msg = decode_ffmpeg_output(error_output) if error_output else "未知错误"
+            logging.error(f"输出路径: {output_path}")
+            logging.error(f"输出目录内容: {os.listdir(os.path.dirname(output_path))}")
+            logging.error(f"FFmpeg错误输出: {error_msg}")
+            raise Exception(f"输出文件未生成。FFmpeg错误: {error_msg}")
+        
+        if os.path.getsize(output_path) == 0:
+            error_msg = decode_ffmpeg_output(error_output) if error_output else "未知错误"
+            try:
+                os.remove(output_path)
+            except:
+                pass
+            raise Exception(f"输出文件大小为0。FFmpeg错误: {error_msg}")
+        
+        logging.info(f"视频处理完成: {output_path}")
+
+    async def process_video_group(self, pairs, total_videos, semaphore):
+        """在同一个ffmpeg进程中处理一组 (主视频, 叠加视频)"""
+        loop = asyncio.get_running_loop()
+        process_key = None
+        jobs = []
+        try:
+            # NVENC每个输出占用一个编码会话，合并处理的一组按输出数占用名额
+            weight = len(pairs) if self._batch_gpu_type == "NVIDIA" else 1
+            async with self._job_slots(semaphore, weight):
+                # 暂停时不启动新的任务，等待继续或停止时被唤醒
+                await self._resume_event.wait()
+                if not self.processing:
+                    return
+                self._running_tasks.add(asyncio.current_task())
                 
-                main_video_name = os.path.splitext(os.path.basename(main_video_path))[0]
-                overlay_name = os.path.splitext(os.path.basename(overlay_video_path))[0]
-                output_name = f"output_{main_video_name}_C_{overlay_name}.mp4"
-                output_path = os.path.join(output_dir, sanitize_filename(output_name))
+                # 探测尺寸等阻塞操作放到线程池中执行，避免阻塞事件循环
+                for main_video_path, overlay_video_path in pairs:
+                    jobs.append(await loop.run_in_executor(
+                        None, self._prepare_job, main_video_path, overlay_video_path
+                    ))
                 
-                # 处理输入和输出路径，确保正确处理中文
+                gpu_type = self._batch_gpu_type
+                cuda_filters = self._use_cuda_filters(gpu_type)
+                command = self._build_command(jobs, gpu_type, cuda_filters)
+                process_key = "|".join(f"{job['main']}_{job['overlay']}" for job in jobs)
+                duration = max(job["duration"] for job in jobs)
                 try:
-                    main_video_path = main_video_path.encode('utf-8').decode('utf-8')
-                    overlay_video_path = overlay_video_path.encode('utf-8').decode('utf-8')
-                    output_path = output_path.encode('utf-8').decode('utf-8')
-                except UnicodeError as e:
-                    logging.error(f"路径编码转换失败: {str(e)}")
-                    raise
-                
-                # 规范化路径
-                main_video_path = normalize_path(main_video_path)
-                overlay_video_path = normalize_path(overlay_video_path)
-                output_path = normalize_path(output_path)
-                
-                # 确保输出目录存在
-                if not ensure_directory(output_path):
-                    raise Exception(f"无法创建输出目录: {os.path.dirname(output_path)}")
-                
-                # 准备路径，不使用引号包裹
-                main_video_path_safe = main_video_path
-                overlay_video_path_safe = overlay_video_path
-                output_path_safe = output_path
-                
-                # 记录实际使用的路径
-                logging.info(f"处理视频:")
-                logging.info(f"主视频: {main_video_path} -> {main_video_path_safe}")
-                logging.info(f"叠加视频: {overlay_video_path} -> {overlay_video_path_safe}")
-                logging.info(f"输出文件: {output_path} -> {output_path_safe}")
-                
-                # 获取视频尺寸
-                width, height = self.get_video_dimensions(main_video_path)
-                if not width or not height:
-                    raise Exception(f"无法获取视频尺寸: {main_video_path}")
-                
-                # 检查GPU支持并设置编码器
-                gpu_type = None
-                if self.use_gpu.get():
-                    gpu_type = self.check_gpu_support()
-                    if gpu_type:
-                        logging.info(f"使用 {gpu_type} GPU加速处理视频")
-                    else:
-                        logging.warning("GPU加速不可用，将使用CPU处理")
-                
-                # 根据GPU类型设置编码器和参数
-                if gpu_type == "NVIDIA":
-                    video_encoder = 'h264_nvenc'
-                    encoder_preset = 'p1'
-                    gpu_params = [
-                        "-rc", "vbr",
-                        "-b:v", "8M",
-                        "-maxrate", "12M",
-                        "-bufsize", "16M",
-                        "-profile:v", "high",
-                        "-level", "5.2",
-                        "-spatial-aq", "1",
-                        "-temporal-aq", "1",
-                        "-cq", "16",
-                        "-qmin", "1",
-                        "-qmax", "51",
-                        "-rc-lookahead", "32"
-                    ]
-                elif gpu_type == "AMD":
-                    video_encoder = 'h264_amf'
-                    encoder_preset = 'quality'
-                    gpu_params = [
-                        "-quality", "quality",
-                        "-rc", "vbr_peak",
-                        "-b:v", "8M",
-                        "-maxrate", "12M",
-                        "-bufsize", "16M",
-                        "-profile:v", "high",
-                        "-qmin", "1",
-                        "-qmax", "51"
-                    ]
-                else:
-                    video_encoder = 'libx264'
-                    encoder_preset = 'slower'
-                    gpu_params = [
-                        "-b:v", "8M",
-                        "-maxrate", "12M",
-                        "-bufsize", "16M",
-                        "-profile:v", "high",
-                        "-level", "5.2",
-                        "-movflags", "+faststart",
-                        "-tune", "film",
-                        "-x264opts", "me=umh:subme=10:ref=5:b-adapt=2:direct=auto:rc-lookahead=60:no-fast-pskip=1:no-dct-decimate=1",
-                        "-psy-rd", "1.0:0.15"
-                    ]
+                    error_output = await self._run_ffmpeg(command, process_key, duration,
+                                                          total_videos, len(jobs))
+                except Exception:
+                    # NVDEC无法解码的输入 (如10位或4:2:2) 无法进入CUDA滤镜，改用CPU滤镜后交给NVENC
+                    if not cuda_filters or not self.processing:
+                        raise
+                    logging.warning("CUDA滤镜处理失败，改用CPU滤镜重试")
+                    self._active_progress.pop(process_key, None)
+                    command = self._build_command(jobs, gpu_type, False)
+                    error_output = await self._run_ffmpeg(command, process_key, duration,
+                                                          total_videos, len(jobs))
+                # 停止时ffmpeg会正常退出，但输出并不完整
+                if not self.processing:
+                    raise ProcessingStopped("处理已停止")
                 
-                if width and height:
-                    # 构建基本的 filter_complex 字符串
-                    filter_str = (
-                        f"[1:v]scale={width}:{height}[scaled];"
-                        f"[scaled]format=rgba,colorchannelmixer=aa={self.opacity_var.get()/100.0}[overlay];"
-                        "[0:v]format=rgba[base];"
-                        "[base][overlay]overlay=0:0:shortest=1[outv]"
-                    )
-                    
-                    # 构建命令
-                    command = [
-                        self.ffmpeg_path,
-                        "-y",
-                        "-hwaccel", "auto" if gpu_type else "none",
-                        "-i", main_video_path_safe,  # 移除引号
-                        "-i", overlay_video_path_safe,  # 移除引号
-                        "-filter_complex", filter_str,
-                        "-map", "[outv]",
-                        "-map", "0:a",
-                        "-c:a", "aac",
-                        "-b:a", "320k",
-                        "-ar", "48000",
-                        "-c:v", video_encoder,
-                        "-preset", encoder_preset,
-                        "-shortest"
-                    ]
-                    
-                    # 添加编码器特定参数
-                    command.extend(gpu_params)
+                # 验证输出文件
+                for job in jobs:
+                    await self._wait_output_stable(job["output"])
+                    self._verify_output(job["output"], error_output)
                     
-                    # 添加输出路径
-                    command.append(output_path_safe)  # 移除引号
-                    
-                    # 记录完整命令
-                    cmd_str = ' '.join(str(x) for x in command)
-                    logging.info(f"执行命令: {cmd_str}")
-                    
-                    # 执行命令并实时捕获输出
-                    process = subprocess.Popen(
-                        command,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        universal_newlines=True,
-                        creationflags=subprocess.CREATE_NO_WINDOW,
-                        bufsize=8192
-                    )
-                    
-                    process_key = f"{main_video_path}_{overlay_video_path}"
-                    self.current_processes[process_key] = process
-                    
-                    try:
-                        # 收集所有错误输出
-                        error_output = []
-                        
-                        # 改进进程监控
-                        while process.poll() is None:
-                            if not self.processing:
-                                process.terminate()
-                                try:
-                                    process.wait(timeout=5)
-                                except subprocess.TimeoutExpired:
-                                    process.kill()
-                                logging.info(f"终止进程: {process_key}")
-                                break
-                            
-                            if self.paused:
-                                time.sleep(0.1)
-                                continue
-                            
-                            # 读取输出
-                            stderr_line = process.stderr.readline()
-                            if stderr_line:
-                                stderr_line = stderr_line.strip()
-                                if stderr_line:  # 只记录非空行
-                                    error_output.append(stderr_line)
-                                    logging.debug(f"FFmpeg输出: {stderr_line}")
-                        
-                        # 检查进程结果
-                        if process.returncode != 0:
-                            stderr = process.stderr.read()
-                            if stderr:
-                                error_output.append(stderr.strip())
-                            error_msg = "\n".join(error_output)
-                            logging.error(f"FFmpeg处理失败: {error_msg}")
-                            raise Exception(f"FFmpeg处理失败: {error_msg}")
-                        
-                    finally:
-                        # 确保关闭所有文件句柄
-                        if process.stdout:
-                            process.stdout.close()
-                        if process.stderr:
-                            process.stderr.close()
-                        process.wait()
-                        
-                        # 从当前进程列表中移除
-                        if process_key in self.current_processes:
-                            del self.current_processes[process_key]
-                    
-                    # 等待一小段时间确保文件写入完成
-                    time.sleep(1.0)
-                    
-                    # 验证输出文件
-                    if not os.path.exists(output_path):
-                        error_msg = "\n".join(error_output) if error_output else "未知错误"
-                        logging.error(f"输出路径: {output_path}")
-                        logging.error(f"输出目录内容: {os.listdir(os.path.dirname(output_path))}")
-                        logging.error(f"FFmpeg错误输出: {error_msg}")
-                        raise Exception(f"输出文件未生成。FFmpeg错误: {error_msg}")
-                    
-                    if os.path.getsize(output_path) == 0:
-                        error_msg = "\n".join(error_output) if error_output else "未知错误"
-                        try:
-                            os.remove(output_path)
-                        except:
-                            pass
-                        raise Exception(f"输出文件大小为0。FFmpeg错误: {error_msg}")
-                    
-                    logging.info(f"视频处理完成: {output_path}")
-                    
-        except Exception as e:
-            # 如果处理失败，尝试清理可能存在的不完整输出文件
-            try:
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-            except:
-                pass
-            logging.error(f"处理视频时出错: {str(e)}")
+        except (Exception, asyncio.CancelledError) as e:
+            # 如果处理失败或被取消，尝试清理可能存在的不完整输出文件
+            for job in jobs:
+                try:
+                    if os.path.exists(job["output"]):
+                        os.remove(job["output"])
+                except:
+                    pass
+            if not isinstance(e, (ProcessingStopped, asyncio.CancelledError)):
+                logging.error(f"处理视频时出错: {str(e)}")
             raise
         finally:
+            self._running_tasks.discard(asyncio.current_task())
             # 清理进程引用
             if process_key in self.current_processes:
                 del self.current_processes[process_key]
+            self._active_progress.pop(process_key, None)
+
+    async def process_video_batch(self, pairs, total_videos, semaphore):
+        """批量处理短视频，合并处理失败时逐个重试"""
+        try:
+            await self.process_video_group(pairs, total_videos, semaphore)
+        except Exception:
+            if not self.processing:
+                raise
+            if len(pairs) <= 1:
+                self._failed_videos.append(pairs[0][0])
+                raise
+            logging.warning(f"合并处理 {len(pairs)} 个视频失败，改为逐个处理")
+            for pair in pairs:
+                if not self.processing:
+                    break
+                try:
+                    await self.process_video_group([pair], total_videos, semaphore)
+                except Exception as e:
+                    logging.error(f"处理视频失败 {pair[0]}: {str(e)}")
+                    self._failed_videos.append(pair[0])
+        finally:
+            # 按完成顺序更新进度
+            self._completed_count += len(pairs)
+            self._report_progress(total_videos)
+
+    @asynccontextmanager
+    async def _job_slots(self, semaphore, weight):
+        """占用 weight 个并发名额；多个名额在锁内依次获取，避免多个任务各拿一部分后互相等待"""
+        acquired = 0
+        try:
+            async with self._slot_lock:
+                while acquired < weight:
+                    await semaphore.acquire()
+                    acquired += 1
+            yield
+        finally:
+            for _ in range(acquired):
+                semaphore.release()
+
+    def _ensure_event_loop(self):
+        """启动运行asyncio事件循环的后台线程，所有ffmpeg子进程都由这一个线程驱动"""
+        if self._loop is None:
+            # 所有进程的输出管道由同一个多路复用器等待：默认事件循环在Windows上为IOCP (Proactor)，
+            # 其他系统为 selectors.DefaultSelector
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        return self._loop
 
-    def _process_videos_thread(self):
+    async def _process_videos(self):
         try:
             total_videos = len(self.main_video_paths)
-            processed_count = 0
-            threads = []
+            self._completed_count = 0
+            self._active_progress = {}
+            self._failed_videos = []
+            missing_videos = []
+            self._resume_event = asyncio.Event()
+            self._sync_resume_event()
+            
+            # 检查GPU支持并设置编码器，本批次的所有任务使用同一结果
+            self._batch_gpu_type = None
+            if self._batch_use_gpu:
+                self._batch_gpu_type = await asyncio.get_running_loop().run_in_executor(
+                    None, self._gpu_type)
+                if self._batch_gpu_type:
+                    logging.info(f"使用 {self._batch_gpu_type} GPU加速处理视频")
+                else:
+                    logging.warning("GPU加速不可用，将使用CPU处理")
             
-            for main_video_path in self.main_video_paths:
+            # NVENC的名额按编码会话计算，同时打开的会话数不超过上限；
+            # 短视频的ffmpeg启动开销占比大，合并处理，NVENC编码时每组的输出数不超过会话名额
+            if self._batch_gpu_type == "NVIDIA":
+                slots = min(self.max_concurrent_jobs, GPU_SESSION_LIMIT)
+                batch_limit = slots
+            else:
+                slots = self.max_concurrent_jobs
+                batch_limit = BATCH_MAX_JOBS
+            semaphore = asyncio.Semaphore(slots)
+            self._slot_lock = asyncio.Lock()
+            logging.info(f"并发名额: {slots}")
+            batchable = batch_limit > 1
+            batches = []
+            pending = []
+            
+            for main_video_path in list(self.main_video_paths):
                 if not self.processing:
                     break
                 
                 if not os.path.exists(main_video_path):
                     logging.error(f"找不到主视频文件: {main_video_path}")
-                    messagebox.showerror("错误", f"找不到主视频文件: {main_video_path}")
+                    missing_videos.append(main_video_path)
                     continue
                 
-                suitable_videos = self.get_suitable_overlay_videos(main_video_path)
-                if not suitable_videos:
+                overlay_video_path = self.select_random_overlay_video(main_video_path)
+                if overlay_video_path is None:
                     logging.warning(f"没有找到合适的混淆视频: {main_video_path}，跳过处理")
                     continue
-                    
-                overlay_video_path = random.choice(suitable_videos)
                 
-                thread = threading.Thread(
-                    target=self.process_video,
-                    args=(main_video_path, overlay_video_path, total_videos, processed_count),
-                    daemon=True
-                )
-                threads.append(thread)
-                thread.start()
+                main_duration = self.main_video_durations.get(main_video_path, 0)
+                if batchable and 0 < main_duration <= BATCH_CLIP_SECONDS:
+                    pending.append((main_video_path, overlay_video_path))
+                    if len(pending) >= batch_limit:
+                        batches.append(pending)
+                        pending = []
+                    continue
                 
-                # 更新进度
-                processed_count += 1
-                self.update_progress(processed_count, total_videos)
+                batches.append([(main_video_path, overlay_video_path)])
             
-                # 等待线程完成
-                thread.join()
+            if pending:
+                batches.append(pending)
+            
+            if missing_videos:
+                self._ui_error(self._summarize("找不到以下主视频文件:", missing_videos))
+            
+            # 所有任务在同一个事件循环中并发执行，并发数由信号量限制；
+            # 单个任务的错误已记录日志，不影响其他任务；停止时未开始的任务会被取消
+            self._batch_tasks = [
+                asyncio.ensure_future(self.process_video_batch(pairs, total_videos, semaphore))
+                for pairs in batches
+            ]
+            for task in asyncio.as_completed(self._batch_tasks):
+                try:
+                    await task
+                except (Exception, asyncio.CancelledError):
+                    pass
+            self._batch_tasks = []
             
             if self.processing:
-                messagebox.showinfo("完成", "所有视频处理完成")
+                if self._failed_videos:
+                    self._ui_error(self._summarize("处理完成，以下视频处理失败:", self._failed_videos))
+                else:
+                    self._post_ui("call", messagebox.showinfo, "完成", "所有视频处理完成")
             
         except Exception as e:
             logging.error(f"处理视频时出错: {str(e)}")
-            messagebox.showerror("错误", f"处理视频时出错: {str(e)}")
+            self._ui_error(f"处理视频时出错: {str(e)}")
         
         finally:
             self.processing = False
             self.current_processes.clear()
-            self.progress_var.set(0)
-            self.status_label.configure(text="就绪")
-            self.time_label.configure(text="预计剩余时间: --:--")
-            self.update_buttons_state()
+            self._post_ui("call", self._reset_progress_ui)
+
+    def _reset_progress_ui(self):
+        """处理结束后恢复界面状态"""
+        self._stopping = False
+        self.progress_var.set(0)
+        self.status_label.configure(text="就绪")
+        self.time_label.configure(text="预计剩余时间: --:--")
+        self.update_buttons_state()
+
+    def _sync_resume_event(self):
+        """根据暂停/停止状态设置事件并挂起或恢复运行中的ffmpeg，只在事件循环线程中调用"""
+        if self._resume_event is None:
+            return
+        suspended = self.paused and self.processing
+        if suspended:
+            self._resume_event.clear()
+        else:
+            self._resume_event.set()
+        for process in self.current_processes.values():
+            if process.returncode is None:
+                suspend_process(process.pid, suspended)
+
+    def _notify_resume_state(self):
+        """从Tk线程通知事件循环暂停状态已改变"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._sync_resume_event)
+
+    def _request_quit(self, process):
+        """向ffmpeg的stdin写入 q，请求其写完文件尾后退出"""
+        try:
+            process.stdin.write(b"q")
+            process.stdin.close()
+        except (OSError, RuntimeError):
+            pass
+
+    async def _terminate_processes(self):
+        """终止所有正在运行的ffmpeg进程"""
+        # 只处理本批次的任务；尚在等待名额或暂停中的任务立即取消，不再启动
+        tasks = list(self._batch_tasks)
+        for task in tasks:
+            if task not in self._running_tasks:
+                task.cancel()
+        running = [(key, process) for key, process in self.current_processes.items()
+                   if process.returncode is None]
+        for process_key, process in running:
+            self._request_quit(process)
+        
+        # 给所有进程共同的退出时限，超时仍未退出的强制结束
+        if running:
+            await asyncio.wait([asyncio.ensure_future(process.wait()) for _, process in running],
+                               timeout=2)
+        for process_key, process in running:
+            try:
+                if process.returncode is None:
+                    process.kill()
+                logging.info(f"终止进程: {process_key}")
+            except Exception as e:
+                logging.error(f"终止进程时出错 {process_key}: {str(e)}")
+        
+        # 子进程终止后取消其余任务
+        for task in tasks:
+            task.cancel()
             
     def stop_processing(self):
         """停止所有视频处理"""
@@ -946,32 +1465,26 @@ class VideoOverlayApp:
             return
             
         try:
-            # 设置停止标志
+            # 设置停止标志，本批次的任务全部退出后才允许重新开始
             self.processing = False
+            self._stopping = True
             logging.info("正在停止所有处理...")
             
-            # 终止所有进程
-            for process_key, process in list(self.current_processes.items()):
-                try:
-                    if process and process.poll() is None:
-                        process.terminate()
-                        try:
-                            process.wait(timeout=5)
-                        except subprocess.TimeoutExpired:
-                            process.kill()
-                        logging.info(f"终止进程: {process_key}")
-                except Exception as e:
-                    logging.error(f"终止进程时出错 {process_key}: {str(e)}")
+            # 先恢复被暂停的进程，使其能读取退出请求
+            self.paused = False
+            self._notify_resume_state()
+            
+            # 终止所有进程，进程由事件循环线程管理
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self._terminate_processes(), self._loop)
             
             # 清理
-            self.current_processes.clear()
             self.progress_var.set(0)
             self.status_label.configure(text="已停止")
             self.time_label.configure(text="预计剩余时间: --:--")
             self.update_buttons_state()
             
             # 重置处理状态
-            self.paused = False
             self.pause_button.configure(text="暂停")
             
         except Exception as e:
@@ -985,6 +1498,12 @@ class VideoOverlayApp:
                 return
             
             self.paused = not self.paused
+            self._notify_resume_state()
+            # 暂停的时间不计入剩余时间的估算
+            if self.paused:
+                self._pause_started = time.time()
+            else:
+                self.start_time += time.time() - self._pause_started
             status = "已暂停" if self.paused else "处理中"
             button_text = "继续" if self.paused else "暂停"
             
@@ -1004,56 +1523,54 @@ class VideoOverlayApp:
                 self.pause_button.configure(state="normal")
                 self.stop_button.configure(state="normal")
                 # 禁用设置选项
-                self.opacity_scale.configure(state="disabled")
-                self.use_gpu.set(self.use_gpu.get())  # 锁定当前值
-                for widget in self.root.winfo_children():
-                    if isinstance(widget, ttk.Checkbutton):
-                        widget.configure(state="disabled")
+                for widget in self._toggleable_widgets:
+                    widget.configure(state="disabled")
+            elif self._stopping:
+                # 等待正在停止的任务退出，设置选项仍保持禁用
+                self.start_button.configure(state="disabled")
+                self.pause_button.configure(state="disabled")
+                self.stop_button.configure(state="disabled")
             else:
                 self.start_button.configure(state="normal")
                 self.pause_button.configure(state="disabled")
                 self.stop_button.configure(state="disabled")
                 # 启用设置选项
-                self.opacity_scale.configure(state="normal")
-                for widget in self.root.winfo_children():
-                    if isinstance(widget, ttk.Checkbutton):
-                        widget.configure(state="normal")
+                for widget in self._toggleable_widgets:
+                    widget.configure(state="normal")
             
-            # 强制更新UI
-            self.root.update()
+            # 只刷新界面绘制，不重入事件处理
+            self.root.update_idletasks()
             
         except Exception as e:
             logging.error(f"更新按钮状态时出错: {str(e)}")
 
-    def update_main_video_list(self):
-        self.video_listbox.delete(0, tk.END)
-        for path in self.main_video_paths:
-            if path in self.main_video_durations:
-                duration = self.main_video_durations[path]
-                filename = os.path.basename(path)
-                self.video_listbox.insert(tk.END, f"{filename} ({duration:.1f}秒)")
-            else:
-                logging.warning(f"找不到视频时长: {path}")
-                filename = os.path.basename(path)
-                self.video_listbox.insert(tk.END, f"{filename}")
+    def _format_row(self, path, durations):
+        """列表中显示的一行：文件名和时长"""
+        filename = os.path.basename(path)
+        if path in durations:
+            return f"{filename} ({durations[path]:.1f}秒)"
+        logging.warning(f"找不到视频时长: {path}")
+        return filename
 
-    def update_overlay_video_list(self):
-        self.overlay_listbox.delete(0, tk.END)
-        for path in self.overlay_video_paths:
-            if path in self.overlay_video_durations:
-                duration = self.overlay_video_durations[path]
-                filename = os.path.basename(path)
-                self.overlay_listbox.insert(tk.END, f"{filename} ({duration:.1f}秒)")
-            else:
-                logging.warning(f"找不到视频时长: {path}")
-                filename = os.path.basename(path)
-                self.overlay_listbox.insert(tk.END, f"{filename}")
+    def _append_rows(self, target, paths):
+        """把新添加的视频追加到列表末尾，不重建已有条目"""
+        if not paths:
+            return
+        if target == "main":
+            listbox, durations = self.video_listbox, self.main_video_durations
+        else:
+            listbox, durations = self.overlay_listbox, self.overlay_video_durations
+        listbox.insert(tk.END, *(self._format_row(path, durations) for path in paths))
 
     def remove_selected_video(self):
         selected = self.video_listbox.curselection()
         for index in reversed(selected):
             self.video_listbox.delete(index)
-            self.main_video_paths.pop(index)
+            path = self.main_video_paths.pop(index)
+            self._main_set.discard(path)
+            self.main_video_durations.pop(path, None)
+            if path not in self._overlay_set:
+                self._prepared_paths.pop(path, None)
             
     def remove_selected_overlay(self):
         selected = self.overlay_listbox.curselection()
@@ -1062,12 +1579,13 @@ class VideoOverlayApp:
             return
             
         for index in reversed(selected):
-            path = self.overlay_video_paths[index]
+            self.overlay_listbox.delete(index)
+            path = self.overlay_video_paths.pop(index)
+            self._overlay_set.discard(path)
+            if path not in self._main_set:
+                self._prepared_paths.pop(path, None)
             if path in self.overlay_video_durations:
-                del self.overlay_video_durations[path]
-            del self.overlay_video_paths[index]
-            
-        self.update_overlay_video_list()
+                self._unindex_overlay(path, self.overlay_video_durations.pop(path))
 
     def select_overlay_video(self):
         filename = filedialog.askopenfilename(filetypes=[("视频文件", "*.mp4 *.avi *.mkv")])
@@ -1086,42 +1604,129 @@ class VideoOverlayApp:
             logging.info(f"设置输出目录: {directory}")
 
     def validate_video_file(self, video_path):
+        return self._cached_meta("valid", video_path,
+                                 lambda: self._probe_video_stream(video_path))
+
+    def _probe_video_stream(self, video_path):
+        """用ffprobe读取视频流信息判断文件是否可用，不解码画面"""
+        command = [
+            self.ffprobe_path,
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name,width,height",
+            "-of", "json",
+            video_path
+        ]
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise Exception("无法打开视频文件")
+            result = subprocess.run(command,
+                                    capture_output=True,
+                                    text=True,
+                                    timeout=5,
+                                    **_POPEN_KW)
+            if result.returncode != 0:
+                raise Exception(result.stderr.strip() or "无法打开视频文件")
             
-            ret, frame = cap.read()
-            cap.release()
-            
-            if not ret:
-                raise Exception("无法读取视频帧")
+            if not json.loads(result.stdout).get("streams"):
+                raise Exception("没有视频流")
             
             return True
         except Exception as e:
             logging.error(f"视频文件验证失败 {video_path}: {str(e)}")
             return False
 
-    def update_progress(self, processed_count, total_videos):
-        """更新进度和预计时间"""
+    def update_progress(self, processed_count, total_videos, current_fraction=0.0):
+        """更新进度和预计时间，current_fraction 为当前文件已完成的比例"""
         if not self.processing:
             return
         
         # 更新进度条
-        progress = (processed_count / total_videos) * 100 if total_videos > 0 else 0
+        done = processed_count + current_fraction
+        progress = (done / total_videos) * 100 if total_videos > 0 else 0
         self.progress_var.set(progress)
         self.status_label.configure(text=f"处理中... ({processed_count}/{total_videos})")
         
         # 计算剩余时间
         elapsed_time = time.time() - self.start_time
-        if processed_count > 0:  # 修改条件，避免除零
-            avg_time_per_video = elapsed_time / processed_count
-            remaining_videos = total_videos - processed_count
+        if done > 0:  # 修改条件，避免除零
+            avg_time_per_video = elapsed_time / done
+            remaining_videos = total_videos - done
             remaining_time = avg_time_per_video * remaining_videos
             remaining_mins = int(remaining_time // 60)
             remaining_secs = int(remaining_time % 60)
             self.time_label.configure(text=f"预计剩余时间: {remaining_mins:02d}:{remaining_secs:02d}")
 
+    def _gpu_type(self):
+        """返回缓存的GPU类型，首次调用时读取磁盘缓存或检测"""
+        # 检测需要启动多个ffmpeg进程，只在 _gpu_detect_lock 内串行执行；
+        # _gpu_type_lock 只保护结果的读写，Tk线程切换选项时不会被检测阻塞
+        with self._gpu_detect_lock:
+            with self._gpu_type_lock:
+                if self._gpu_type_cache is not _UNSET:
+                    return self._gpu_type_cache
+                redetect = self._gpu_redetect
+                generation = self._gpu_generation
+
+            cached = _UNSET if redetect else self._load_cached_gpu()
+            if cached is _UNSET:
+                gpu_type = self.check_gpu_support()
+                cuda_filters = gpu_type == "NVIDIA" and self.check_cuda_filters()
+                self._save_cached_gpu(gpu_type, cuda_filters)
+            else:
+                gpu_type, cuda_filters = cached
+
+            with self._gpu_type_lock:
+                # 检测期间用户切换了选项时不发布旧结果，下次调用重新检测
+                if self._gpu_generation == generation:
+                    self._gpu_type_cache = gpu_type
+                    self._cuda_filters = cuda_filters
+                    self._gpu_redetect = False
+            return gpu_type
+
+    def _ffmpeg_signature(self):
+        """返回ffmpeg可执行文件的 (路径, 修改时间)，ffmpeg更新后GPU检测结果随之失效"""
+        path = shutil.which(self.ffmpeg_path) or self.ffmpeg_path
+        return os.path.abspath(path), os.stat(path).st_mtime_ns
+
+    def _load_cached_gpu(self):
+        """读取上次的 (GPU类型, 是否可用CUDA滤镜)，不存在或已失效时返回_UNSET"""
+        try:
+            with open(os.path.join(get_cache_dir(), "gpu.json"), encoding="utf-8") as f:
+                cached = json.load(f)
+            ffmpeg_path, ffmpeg_mtime = self._ffmpeg_signature()
+            if (cached.get("ffmpeg") == ffmpeg_path and cached.get("ffmpeg_mtime") == ffmpeg_mtime
+                    and cached.get("gpu") and "cuda_filters" in cached):
+                logging.info(f"使用缓存的GPU检测结果: {cached['gpu']}")
+                return cached.get("gpu"), bool(cached["cuda_filters"])
+        except (OSError, ValueError, AttributeError):
+            pass
+        return _UNSET
+
+    def _save_cached_gpu(self, gpu_type, cuda_filters):
+        """保存GPU检测结果，下次启动时无需重新检测；未检测到GPU时删除旧结果"""
+        cache_path = os.path.join(get_cache_dir(), "gpu.json")
+        try:
+            # 测试编码失败可能只是暂时的 (如编码器被其他程序占用、驱动刚安装)，不保存，下次启动重新检测
+            if not gpu_type:
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+                return
+            ffmpeg_path, ffmpeg_mtime = self._ffmpeg_signature()
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"ffmpeg": ffmpeg_path, "ffmpeg_mtime": ffmpeg_mtime,
+                           "gpu": gpu_type, "cuda_filters": cuda_filters}, f)
+        except OSError as e:
+            logging.warning(f"保存GPU检测结果失败: {str(e)}")
+
+    def _on_use_gpu_changed(self, *args):
+        """用户切换GPU选项时使检测结果缓存失效"""
+        use_gpu = self.use_gpu.get()
+        if use_gpu != self._last_use_gpu:
+            self._last_use_gpu = use_gpu
+            with self._gpu_type_lock:
+                self._gpu_type_cache = _UNSET
+                self._gpu_redetect = True  # 用户重新选择时重新检测，不使用磁盘缓存
+                self._gpu_generation += 1
+
     def check_gpu_support(self):
         """检查GPU加速支持情况"""
         try:
@@ -1133,7 +1738,7 @@ class VideoOverlayApp:
             result = subprocess.run(cmd, 
                                   capture_output=True, 
                                   text=True, 
-                                  creationflags=subprocess.CREATE_NO_WINDOW)
+                                  **_POPEN_KW)
             
             encoders = result.stdout
             gpu_type = None
@@ -1150,7 +1755,7 @@ class VideoOverlayApp:
                     "-f", "null",
                     "-"
                 ]
-                if subprocess.run(test_cmd, capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW).returncode == 0:
+                if subprocess.run(test_cmd, capture_output=True, **_POPEN_KW).returncode == 0:
                     gpu_type = "NVIDIA"
                     logging.info("NVIDIA GPU加速可用")
             
@@ -1166,7 +1771,7 @@ class VideoOverlayApp:
                     "-f", "null",
                     "-"
                 ]
-                if subprocess.run(test_cmd, capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW).returncode == 0:
+                if subprocess.run(test_cmd, capture_output=True, **_POPEN_KW).returncode == 0:
                     gpu_type = "AMD"
                     logging.info("AMD GPU加速可用")
             
@@ -1176,33 +1781,64 @@ class VideoOverlayApp:
             logging.warning(f"检查GPU支持时出错: {str(e)}")
             return None
 
+    def check_cuda_filters(self):
+        """检查ffmpeg是否支持在显存中缩放和叠加 (scale_cuda/overlay_cuda)"""
+        test_cmd = [
+            self.ffmpeg_path,
+            "-hide_banner",
+            "-f", "lavfi",
+            "-i", "color=black:s=320x240:r=30",
+            "-f", "lavfi",
+            "-i", "color=white:s=320x240:r=30",
+            "-t", "0.2",
+            "-filter_complex",
+            "[1:v]format=yuva420p,hwupload_cuda[o];"
+            "[0:v]format=yuv420p,hwupload_cuda,scale_cuda=format=yuv420p[b];"
+            "[b][o]overlay_cuda=0:0[v]",
+            "-map", "[v]",
+            "-c:v", "h264_nvenc",
+            "-f", "null",
+            "-"
+        ]
+        try:
+            if subprocess.run(test_cmd, capture_output=True, **_POPEN_KW).returncode == 0:
+                logging.info("CUDA滤镜可用，叠加在GPU上完成")
+                return True
+        except Exception as e:
+            logging.warning(f"检查CUDA滤镜时出错: {str(e)}")
+        logging.warning("CUDA滤镜不可用，使用CPU滤镜后交给NVENC编码")
+        return False
+
+    def _use_cuda_filters(self, gpu_type):
+        """NVIDIA编码且CUDA滤镜可用时，在显存中完成叠加"""
+        return gpu_type == "NVIDIA" and self._cuda_filters
+
     def setup_drag_drop(self):
         """设置拖放功能"""
         def handle_files(files, target_type):
+            video_paths = []
             for file_path in files:
-                # 将 bytes 转换为 str
-                if isinstance(file_path, bytes):
-                    try:
-                        file_path = file_path.decode('gbk')  # Windows 中文系统使用 GBK 编码
-                    except UnicodeDecodeError:
-                        try:
-                            file_path = file_path.decode('utf-8')  # 尝试 UTF-8
-                        except UnicodeDecodeError:
-                            logging.error(f"无法解码文件路径: {file_path}")
-                            continue
+                # 已请求windnd返回Unicode路径；仍收到 bytes 时按文件系统编码转换，与 open() 一致
+                if isinstance(file_path, (bytes, bytearray)):
+                    file_path = os.fsdecode(bytes(file_path))
 
                 if os.path.isdir(file_path):
-                    self.import_folder(file_path, target_type)
+                    video_paths.extend(self._collect_folder_videos(file_path))
                 elif is_video_file(file_path):
-                    self.add_video(file_path, target_type)
+                    video_paths.append(file_path)
+
+            # 所有拖入的视频一次性并行探测
+            self.import_videos(video_paths, target_type)
 
         # 为主视频列表框添加拖放功能
         windnd.hook_dropfiles(self.video_listbox, 
-                            func=lambda files: handle_files(files, "main"))
+                            func=lambda files: handle_files(files, "main"),
+                            force_unicode=True)
 
         # 为叠加视频列表框添加拖放功能
         windnd.hook_dropfiles(self.overlay_listbox, 
-                            func=lambda files: handle_files(files, "overlay"))
+                            func=lambda files: handle_files(files, "overlay"),
+                            force_unicode=True)
 
         # 为窗口添加拖放功能
         def handle_window_drop(files):
@@ -1214,7 +1850,7 @@ class VideoOverlayApp:
             else:
                 handle_files(files, "overlay")
 
-        windnd.hook_dropfiles(self.root, func=handle_window_drop)
+        windnd.hook_dropfiles(self.root, func=handle_window_drop, force_unicode=True)
             
 if __name__ == "__main__":
     root = tk.Tk()
@@ -7,9 +7,10 @@ a = Analysis(
     pathex=[],
     binaries=[
         ('ffmpeg/ffmpeg.exe', '.'),  # 使用已有的ffmpeg
+        ('ffmpeg/ffprobe.exe', '.'),  # 读取视频时长/尺寸
     ],
     datas=[],
-    hiddenimports=['PyQt6.QtCore', 'PyQt6.QtGui', 'PyQt6.QtWidgets', 'cv2'],
+    hiddenimports=['PyQt6.QtCore', 'PyQt6.QtGui', 'PyQt6.QtWidgets'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],